@@ -7,7 +7,7 @@ __license__ = "GPL"
 import logging
 import datetime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, Date, Float, Time
+from sqlalchemy import Column, Integer, Date, Float, Time, func
 
 import Fit
 import HealthDB
@@ -15,6 +15,23 @@ import HealthDB
 
 logger = logging.getLogger(__name__)
 
+_ONE_DAY = datetime.timedelta(days=1)
+_ONE_WEEK = datetime.timedelta(days=7)
+
+_MIN_TO_DT_TIME_CACHE_SIZE = 256
+_min_to_dt_time_cache = {}
+
+
+def _cached_min_to_dt_time(minutes):
+    """Return Fit.conversions.min_to_dt_time(minutes), memoized since the same minute totals recur across stats."""
+    dt_time = _min_to_dt_time_cache.get(minutes)
+    if dt_time is None:
+        if len(_min_to_dt_time_cache) >= _MIN_TO_DT_TIME_CACHE_SIZE:
+            _min_to_dt_time_cache.clear()
+        dt_time = Fit.conversions.min_to_dt_time(minutes)
+        _min_to_dt_time_cache[minutes] = dt_time
+    return dt_time
+
 
 class FitBitDB(HealthDB.DB):
     Base = declarative_base()
@@ -61,13 +78,10 @@ class DaysSummary(FitBitDB.Base, HealthDB.DBObject):
 
     @classmethod
     def get_activity_mins_stats(cls, db, func, start_ts, end_ts):
-        moderate_activity_time = Fit.conversions.min_to_dt_time(func(db, cls.fairly_active_mins, start_ts, end_ts))
-        vigorous_activity_time = Fit.conversions.min_to_dt_time(func(db, cls.very_active_mins, start_ts, end_ts))
-        intensity_time = datetime.time.min
-        if moderate_activity_time:
-            intensity_time = Fit.conversions.add_time(intensity_time, moderate_activity_time)
-        if vigorous_activity_time:
-            intensity_time = Fit.conversions.add_time(intensity_time, vigorous_activity_time, 2)
+        moderate_activity_time = _cached_min_to_dt_time(func(db, cls.fairly_active_mins, start_ts, end_ts))
+        vigorous_activity_time = _cached_min_to_dt_time(func(db, cls.very_active_mins, start_ts, end_ts))
+        # vigorous minutes count double toward intensity time
+        intensity_time = Fit.conversions.add_time(moderate_activity_time or datetime.time.min, vigorous_activity_time or datetime.time.min, 2)
         stats = {
             'intensity_time'            : intensity_time,
             'moderate_activity_time'    : moderate_activity_time,
@@ -85,54 +99,54 @@ class DaysSummary(FitBitDB.Base, HealthDB.DBObject):
 
     @classmethod
     def get_weight_stats(cls, db, start_ts, end_ts):
-        stats = {
-            'weight_avg' : cls.get_col_avg(db, cls.weight, start_ts, end_ts, True),
-            'weight_min' : cls.get_col_min(db, cls.weight, start_ts, end_ts, True),
-            'weight_max' : cls.get_col_max(db, cls.weight, start_ts, end_ts),
-        }
-        return stats
+        return cls.get_stats_bulk(db, [
+            ('weight_avg', func.avg, cls.col_gt_zero(cls.weight)),
+            ('weight_min', func.min, cls.col_gt_zero(cls.weight)),
+            ('weight_max', func.max, cls.weight),
+        ], start_ts, end_ts)
 
     @classmethod
     def get_sleep_stats(cls, db, start_ts, end_ts):
-        return {
-            'sleep_avg' : Fit.conversions.min_to_dt_time(cls.get_col_avg(db, cls.asleep_mins, start_ts, end_ts, True)),
-            'sleep_min' : Fit.conversions.min_to_dt_time(cls.get_col_min(db, cls.asleep_mins, start_ts, end_ts, True)),
-            'sleep_max' : Fit.conversions.min_to_dt_time(cls.get_col_max(db, cls.asleep_mins, start_ts, end_ts)),
-        }
+        stats = cls.get_stats_bulk(db, [
+            ('sleep_avg', func.avg, cls.col_gt_zero(cls.asleep_mins)),
+            ('sleep_min', func.min, cls.col_gt_zero(cls.asleep_mins)),
+            ('sleep_max', func.max, cls.asleep_mins),
+        ], start_ts, end_ts)
+        return {key : _cached_min_to_dt_time(value) for key, value in stats.iteritems()}
 
     @classmethod
     def get_calories_stats(cls, db, start_ts, end_ts):
-        calories_bmr_avg = cls.get_col_avg(db, cls.calories_bmr, start_ts, end_ts)
-        calories_active_avg = cls.get_col_avg(db, cls.activities_calories, start_ts, end_ts)
-        if calories_bmr_avg is not None and calories_active_avg is not None:
-            calories_avg = calories_bmr_avg + calories_active_avg
+        stats = cls.get_stats_bulk(db, [
+            ('calories_bmr_avg',    func.avg, cls.calories_bmr),
+            ('calories_active_avg', func.avg, cls.activities_calories),
+        ], start_ts, end_ts)
+        if stats['calories_bmr_avg'] is not None and stats['calories_active_avg'] is not None:
+            stats['calories_avg'] = stats['calories_bmr_avg'] + stats['calories_active_avg']
         else:
-            calories_avg = None
-        return {
-            'calories_avg'          : calories_avg,
-            'calories_bmr_avg'      : calories_bmr_avg,
-            'calories_active_avg'   : calories_active_avg,
-        }
+            stats['calories_avg'] = None
+        return stats
 
     @classmethod
     def get_daily_stats(cls, db, day_ts):
-        stats = cls.get_activity_mins_stats(db, cls.get_col_sum, day_ts, day_ts + datetime.timedelta(1))
-        stats.update(cls.get_floors_stats(db, cls.get_col_sum, day_ts, day_ts + datetime.timedelta(1)))
-        stats.update(cls.get_steps_stats(db, cls.get_col_sum, day_ts, day_ts + datetime.timedelta(1)))
-        stats.update(cls.get_weight_stats(db, day_ts, day_ts + datetime.timedelta(1)))
-        stats.update(cls.get_sleep_stats(db, day_ts, day_ts + datetime.timedelta(1)))
-        stats.update(cls.get_calories_stats(db, day_ts, day_ts + datetime.timedelta(1)))
+        end_ts = day_ts + _ONE_DAY
+        stats = cls.get_activity_mins_stats(db, cls.get_col_sum, day_ts, end_ts)
+        stats.update(cls.get_floors_stats(db, cls.get_col_sum, day_ts, end_ts))
+        stats.update(cls.get_steps_stats(db, cls.get_col_sum, day_ts, end_ts))
+        stats.update(cls.get_weight_stats(db, day_ts, end_ts))
+        stats.update(cls.get_sleep_stats(db, day_ts, end_ts))
+        stats.update(cls.get_calories_stats(db, day_ts, end_ts))
         stats['day'] = day_ts
         return stats
 
     @classmethod
     def get_weekly_stats(cls, db, first_day_ts):
-        stats = cls.get_activity_mins_stats(db, cls.get_col_sum, first_day_ts, first_day_ts + datetime.timedelta(7))
-        stats.update(cls.get_floors_stats(db, cls.get_col_sum, first_day_ts, first_day_ts + datetime.timedelta(7)))
-        stats.update(cls.get_steps_stats(db, cls.get_col_sum, first_day_ts, first_day_ts + datetime.timedelta(7)))
-        stats.update(cls.get_weight_stats(db, first_day_ts, first_day_ts + datetime.timedelta(7)))
-        stats.update(cls.get_sleep_stats(db, first_day_ts, first_day_ts + datetime.timedelta(7)))
-        stats.update(cls.get_calories_stats(db, first_day_ts, first_day_ts + datetime.timedelta(7)))
+        end_ts = first_day_ts + _ONE_WEEK
+        stats = cls.get_activity_mins_stats(db, cls.get_col_sum, first_day_ts, end_ts)
+        stats.update(cls.get_floors_stats(db, cls.get_col_sum, first_day_ts, end_ts))
+        stats.update(cls.get_steps_stats(db, cls.get_col_sum, first_day_ts, end_ts))
+        stats.update(cls.get_weight_stats(db, first_day_ts, end_ts))
+        stats.update(cls.get_sleep_stats(db, first_day_ts, end_ts))
+        stats.update(cls.get_calories_stats(db, first_day_ts, end_ts))
         stats['first_day'] = first_day_ts
         return stats
 
@@ -7,7 +7,7 @@ __license__ = "GPL"
 import os
 import datetime
 import logging
-from sqlalchemy import Column, Integer, Date, DateTime, Time, Float, String, Enum, ForeignKey, func
+from sqlalchemy import Column, Integer, Date, DateTime, Time, Float, String, ForeignKey, func, cast, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
 
@@ -42,11 +42,13 @@ class GarminDB(HealthDB.DB):
         GarminDB.Base.metadata.create_all(self.engine)
         self.version = GarminDB._DbVersion()
         self.version.version_check(self, self.db_version)
-        self.tables = [Attributes, Device, DeviceInfo, File, Weight, Stress, Sleep, SleepEvents, RestingHeartRate, DailySummary, DailyExtraData]
+        self.tables = [Attributes, Device, Manufacturers, DeviceInfo, File, FileTypes, Weight, Stress, Sleep, SleepEvents, RestingHeartRate, DailySummary, DailyExtraData]
         for table in self.tables:
             self.version.table_version_check(self, table)
             if not self.version.view_version_check(self, table):
                 table.delete_view(self)
+        Manufacturers.populate(self)
+        FileTypes.populate(self)
         DeviceInfo.create_view(self)
         File.create_view(self)
 
@@ -57,10 +59,38 @@ class Attributes(GarminDB.Base, HealthDB.KeyValueObject):
     __tablename__ = 'attributes'
     table_version = 1
 
+    # bumped whenever an attribute changes, so the measurements type cached on any db instance is read again
+    _generation = 0
+
+    @classmethod
+    def __attributes_changed(cls, *args):
+        cls._generation += 1
+
+    @classmethod
+    def set(cls, db, key, value, timestamp=datetime.datetime.now()):
+        """Set a key-value pair in the database."""
+        super(Attributes, cls).set(db, key, value, timestamp)
+        cls.__attributes_changed()
+
+    @classmethod
+    def _set_newer(cls, session, key, value, timestamp=datetime.datetime.now()):
+        """Set a key-value pair in the database if the timestamp is newer than the one in the database."""
+        super(Attributes, cls)._set_newer(session, key, value, timestamp)
+        cls.__attributes_changed()
+        # other sessions only see the new value once this session commits
+        if not event.contains(session, 'after_commit', cls.__attributes_changed):
+            event.listen(session, 'after_commit', cls.__attributes_changed)
+
     @classmethod
     def measurements_type(cls, db):
         """Return the database units type (metric, statute, etc)."""
-        return Fit.field_enums.DisplayMeasure.from_string(cls.get(db, 'measurement_system'))
+        # cached on the db instance along with the attributes generation it was read at
+        cached = getattr(db, '_measurements_type', None)
+        if cached is None or cached[0] != cls._generation:
+            generation = cls._generation
+            cached = (generation, Fit.field_enums.DisplayMeasure.from_string(cls.get(db, 'measurement_system')))
+            db._measurements_type = cached
+        return cached[1]
 
     @classmethod
     def measurements_type_metric(cls, db):
@@ -72,14 +102,14 @@ class Device(GarminDB.Base, HealthDB.DBObject):
     """Class representing a Garmin device."""
 
     __tablename__ = 'devices'
-    table_version = 3
+    table_version = 4
     unknown_device_serial_number = 9999999999
 
     Manufacturer = HealthDB.derived_enum.derive('Manufacturer', Fit.field_enums.Manufacturer, {'Microsoft' : 100001, 'Unknown': 100000})
 
     serial_number = Column(Integer, primary_key=True)
     timestamp = Column(DateTime)
-    manufacturer = Column(Enum(Manufacturer))
+    manufacturer = Column(HealthDB.EnumAsInt(Manufacturer))
     product = Column(String)
     hardware_version = Column(String)
 
@@ -106,12 +136,12 @@ class DeviceInfo(GarminDB.Base, HealthDB.DBObject):
     """Class representing a Garmin device info message from a FIT file."""
 
     __tablename__ = 'device_info'
-    table_version = 2
-    view_version = 4
+    table_version = 3
+    view_version = 5
 
     id = Column(Integer, primary_key=True)
-    timestamp = Column(DateTime, nullable=False)
-    file_id = Column(String, ForeignKey('files.id'))
+    timestamp = Column(DateTime, nullable=False, index=True)
+    file_id = Column(String, ForeignKey('files.id'), index=True)
     serial_number = Column(Integer, ForeignKey('devices.serial_number'), nullable=False)
     device_type = Column(String)
     software_version = Column(String)
@@ -124,34 +154,36 @@ class DeviceInfo(GarminDB.Base, HealthDB.DBObject):
     @classmethod
     def create_view(cls, db):
         """Create a databse view that presents the device info data in a more user friendly way."""
-        cls.create_join_view(db, cls._get_default_view_name(),
+        cls.create_multi_join_view(db, cls._get_default_view_name(),
             [
                 cls.timestamp.label('timestamp'),
                 cls.file_id.label('file_id'),
                 cls.serial_number.label('serial_number'),
                 cls.device_type.label('device_type'),
                 cls.software_version.label('software_version'),
-                Device.manufacturer.label('manufacturer'),
+                Manufacturers.name.label('manufacturer'),
                 Device.product.label('product'),
                 Device.hardware_version.label('hardware_version')
             ],
-            Device, cls.timestamp.desc())
+            [(Device, cls.serial_number == Device.serial_number)],
+            cls.timestamp.desc(),
+            [(Manufacturers, Device.manufacturer == Manufacturers.value)])
 
 
 class File(GarminDB.Base, HealthDB.DBObject):
     """Class representing a data file."""
 
     __tablename__ = 'files'
-    table_version = 3
-    view_version = 4
+    table_version = 5
+    view_version = 5
 
     fit_file_types_prefix = 'fit_'
     FileType = HealthDB.derived_enum.derive('FileType', Fit.field_enums.FileType, {'tcx' : 100001, 'gpx' : 100002}, fit_file_types_prefix)
 
     id = Column(String, primary_key=True)
     name = Column(String, unique=True)
-    type = Column(Enum(FileType), nullable=False)
-    serial_number = Column(Integer, ForeignKey('devices.serial_number'))
+    type = Column(HealthDB.EnumAsInt(FileType), nullable=False)
+    serial_number = Column(Integer, ForeignKey('devices.serial_number'), index=True)
 
     match_col_names = ['name']
 
@@ -173,36 +205,57 @@ class File(GarminDB.Base, HealthDB.DBObject):
                 DeviceInfo.timestamp.label('timestamp'),
                 cls.id.label('activity_id'),
                 cls.name.label('name'),
-                cls.type.label('type'),
-                Device.manufacturer.label('manufacturer'),
+                FileTypes.name.label('type'),
+                Manufacturers.name.label('manufacturer'),
                 Device.product.label('product'),
                 Device.serial_number.label('serial_number')
             ],
             [(Device, File.serial_number == Device.serial_number), (DeviceInfo, File.id == DeviceInfo.file_id)],
-            DeviceInfo.timestamp.desc())
+            DeviceInfo.timestamp.desc(),
+            [(FileTypes, File.type == FileTypes.value), (Manufacturers, Device.manufacturer == Manufacturers.value)])
 
     @classmethod
     def name_and_id_from_path(cls, pathname):
         """Return the name and id of a file given it's pathname."""
         name = os.path.basename(pathname)
-        id = name.split('.')[0]
+        id = os.path.splitext(name)[0]
         return (id, name)
 
     @classmethod
     def id_from_path(cls, pathname):
         """Return the id of a file given it's pathname."""
-        return os.path.basename(pathname).split('.')[0]
+        return os.path.splitext(os.path.basename(pathname))[0]
+
+
+class Manufacturers(GarminDB.Base, HealthDB.EnumLookupObject):
+    """Class representing the names of the manufacturer values stored in the devices table."""
+
+    __tablename__ = 'manufacturers'
+    table_version = 1
+
+    enum_type = Device.Manufacturer
+
+
+class FileTypes(GarminDB.Base, HealthDB.EnumLookupObject):
+    """Class representing the names of the file type values stored in the files table."""
+
+    __tablename__ = 'file_types'
+    table_version = 1
+
+    enum_type = File.FileType
 
 
 class Weight(GarminDB.Base, HealthDB.DBObject):
     """Class representing a weight entry."""
 
     __tablename__ = 'weight'
-    table_version = 1
+    table_version = 2
 
     day = Column(Date, primary_key=True)
     weight = Column(Float, nullable=False)
 
+    __table_args__ = {'sqlite_with_rowid' : False}
+
     time_col_name = 'day'
 
     @classmethod
@@ -238,7 +291,7 @@ class Sleep(GarminDB.Base, HealthDB.DBObject):
     """Class representing a sleep session."""
 
     __tablename__ = 'sleep'
-    table_version = 1
+    table_version = 2
 
     day = Column(Date, primary_key=True)
     start = Column(DateTime)
@@ -249,6 +302,8 @@ class Sleep(GarminDB.Base, HealthDB.DBObject):
     rem_sleep = Column(Time, nullable=False, default=datetime.time.min)
     awake = Column(Time, nullable=False, default=datetime.time.min)
 
+    __table_args__ = {'sqlite_with_rowid' : False}
+
     time_col_name = 'day'
 
     @classmethod
@@ -287,11 +342,13 @@ class RestingHeartRate(GarminDB.Base, HealthDB.DBObject):
     """Class representing a daily resting heart rate reading."""
 
     __tablename__ = 'resting_hr'
-    table_version = 1
+    table_version = 2
 
     day = Column(Date, primary_key=True)
     resting_heart_rate = Column(Float)
 
+    __table_args__ = {'sqlite_with_rowid' : False}
+
     time_col_name = 'day'
 
     @classmethod
@@ -308,7 +365,7 @@ class DailySummary(GarminDB.Base, HealthDB.DBObject):
     """Class representing a Garmin daily summary."""
 
     __tablename__ = 'daily_summary'
-    table_version = 1
+    table_version = 2
 
     day = Column(Date, primary_key=True)
     hr_min = Column(Integer)
@@ -331,12 +388,20 @@ class DailySummary(GarminDB.Base, HealthDB.DBObject):
     calories_consumed = Column(Integer)
     description = Column(String)
 
+    __table_args__ = {'sqlite_with_rowid' : False}
+
     time_col_name = 'day'
 
     @hybrid_property
     def intensity_time(self):
         """Return intensity_time computed from moderate_activity_time and vigorous_activity_time."""
-        return Fit.conversions.add_time(self.moderate_activity_time, self.vigorous_activity_time, 2)
+        # memoized on the instance, keyed on the values it was computed from
+        activity_times = (self.moderate_activity_time, self.vigorous_activity_time)
+        cached = self.__dict__.get('_intensity_time_cache')
+        if cached is None or cached[0] != activity_times:
+            cached = (activity_times, Fit.conversions.add_time(self.moderate_activity_time, self.vigorous_activity_time, 2))
+            self.__dict__['_intensity_time_cache'] = cached
+        return cached[1]
 
     @intensity_time.expression
     def intensity_time(cls):
@@ -346,14 +411,16 @@ class DailySummary(GarminDB.Base, HealthDB.DBObject):
     @hybrid_property
     def intensity_time_goal_percent(self):
         """Return the percentage of intensity time goal achieved."""
-        if self.intensity_time is not None and self.intensity_time_goal is not None:
-            return (conversions.time_to_secs(self.intensity_time) * 100) / conversions.time_to_secs(self.intensity_time_goal)
+        intensity_time = self.intensity_time
+        if intensity_time is not None and self.intensity_time_goal is not None:
+            return (conversions.time_to_secs(intensity_time) * 100) / conversions.time_to_secs(self.intensity_time_goal)
         return 0.0
 
     @intensity_time_goal_percent.expression
     def intensity_time_goal_percent(cls):
         """Return the percentage of intensity time goal achieved."""
-        return func.round((cls.secs_from_time(cls.intensity_time) * 100) / cls.secs_from_time(cls.intensity_time_goal))
+        intensity_secs = 2 * cls.secs_from_time(cls.vigorous_activity_time) + cls.secs_from_time(cls.moderate_activity_time)
+        return func.round((intensity_secs * 100) / func.nullif(cls.secs_from_time(cls.intensity_time_goal), 0))
 
     @hybrid_property
     def steps_goal_percent(self):
@@ -365,7 +432,7 @@ class DailySummary(GarminDB.Base, HealthDB.DBObject):
     @steps_goal_percent.expression
     def steps_goal_percent(cls):
         """Return the percentage of steps goal achieved."""
-        return func.round((cls.steps * 100) / cls.step_goal)
+        return func.round((cls.steps * 100) / func.nullif(cls.step_goal, 0))
 
     @hybrid_property
     def floors_goal_percent(self):
@@ -377,28 +444,31 @@ class DailySummary(GarminDB.Base, HealthDB.DBObject):
     @floors_goal_percent.expression
     def floors_goal_percent(cls):
         """Return the percentage of floors goal achieved."""
-        return func.round((cls.floors_up * 100) / cls.floors_goal)
+        return func.round((cls.floors_up * 100) / func.nullif(cls.floors_goal, 0))
 
     @classmethod
     def get_stats(cls, session, start_ts, end_ts):
-        return {
-            'rhr_avg'                   : cls._get_col_avg(session, cls.rhr, start_ts, end_ts),
-            'rhr_min'                   : cls._get_col_min(session, cls.rhr, start_ts, end_ts),
-            'rhr_max'                   : cls._get_col_max(session, cls.rhr, start_ts, end_ts),
-            'stress_avg'                : cls._get_col_avg(session, cls.stress_avg, start_ts, end_ts),
-            'steps'                     : cls._get_col_sum(session, cls.steps, start_ts, end_ts),
-            'steps_goal'                : cls._get_col_sum(session, cls.step_goal, start_ts, end_ts),
-            'floors'                    : cls._get_col_sum(session, cls.floors_up, start_ts, end_ts),
-            'floors_goal'               : cls._get_col_sum(session, cls.floors_goal, start_ts, end_ts),
-            'calories_goal'             : cls._get_col_avg(session, cls.calories_goal, start_ts, end_ts),
-            'intensity_time'            : cls._get_time_col_sum(session, cls.intensity_time, start_ts, end_ts),
-            'moderate_activity_time'    : cls._get_time_col_sum(session, cls.moderate_activity_time, start_ts, end_ts),
-            'vigorous_activity_time'    : cls._get_time_col_sum(session, cls.vigorous_activity_time, start_ts, end_ts),
-            'intensity_time_goal'       : cls._get_time_col_avg(session, cls.intensity_time_goal, start_ts, end_ts),
-            'calories_avg'              : cls._get_col_avg(session, cls.calories_total, start_ts, end_ts),
-            'calories_bmr_avg'          : cls._get_col_avg(session, cls.calories_bmr, start_ts, end_ts),
-            'calories_active_avg'       : cls._get_col_avg(session, cls.calories_active, start_ts, end_ts),
-        }
+        stats = cls._get_stats_bulk(session, [
+            ('rhr_avg',                 func.avg, cls.rhr),
+            ('rhr_min',                 func.min, cls.rhr),
+            ('rhr_max',                 func.max, cls.rhr),
+            ('stress_avg',              func.avg, cls.stress_avg),
+            ('steps',                   func.sum, cls.steps),
+            ('steps_goal',              func.sum, cls.step_goal),
+            ('floors',                  func.sum, cls.floors_up),
+            ('floors_goal',             func.sum, cls.floors_goal),
+            ('calories_goal',           func.avg, cls.calories_goal),
+            ('intensity_time',          cls.time_col_func(func.sum), cls.intensity_time),
+            ('moderate_activity_time',  cls.time_col_func(func.sum), cls.moderate_activity_time),
+            ('vigorous_activity_time',  cls.time_col_func(func.sum), cls.vigorous_activity_time),
+            ('intensity_time_goal',     cls.time_col_func(func.avg), cls.intensity_time_goal),
+            ('calories_avg',            func.avg, cls.calories_total),
+            ('calories_bmr_avg',        func.avg, cls.calories_bmr),
+            ('calories_active_avg',     func.avg, cls.calories_active),
+        ], start_ts, end_ts)
+        for time_stat in ['intensity_time', 'moderate_activity_time', 'vigorous_activity_time', 'intensity_time_goal']:
+            stats[time_stat] = cls.time_from_result(stats[time_stat])
+        return stats
 
     @classmethod
     def get_daily_stats(cls, session, day_ts):
@@ -412,20 +482,13 @@ class DailySummary(GarminDB.Base, HealthDB.DBObject):
     def get_monthly_stats(cls, session, first_day_ts, last_day_ts):
         stats = cls.get_stats(session, first_day_ts, last_day_ts)
         # intensity time is a weekly goal, so sum up the weekly average values
-        first_week_end = first_day_ts + datetime.timedelta(7)
-        second_week_end = first_day_ts + datetime.timedelta(14)
-        third_week_end = first_day_ts + datetime.timedelta(21)
-        fourth_week_end = first_day_ts + datetime.timedelta(28)
-        stats['intensity_time_goal'] = Fit.conversions.add_time(
-            Fit.conversions.add_time(
-                cls._get_time_col_avg(session, cls.intensity_time_goal, first_day_ts, first_week_end),
-                cls._get_time_col_avg(session, cls.intensity_time_goal, first_week_end, second_week_end)
-            ),
-            Fit.conversions.add_time(
-                cls._get_time_col_avg(session, cls.intensity_time_goal, second_week_end, third_week_end),
-                cls._get_time_col_avg(session, cls.intensity_time_goal, third_week_end, fourth_week_end)
-            )
+        fourth_week_end = datetime.date.fromordinal(first_day_ts.toordinal() + 28)
+        week = cast((func.julianday(cls.day) - func.julianday(first_day_ts)) / 7, Integer)
+        weekly_goal_avgs = (
+            cls._query(session, func.avg(cls.col_gt_zero(cls.secs_from_time(cls.intensity_time_goal))), None, first_day_ts, fourth_week_end)
+            .group_by(week).all()
         )
+        stats['intensity_time_goal'] = Fit.conversions.secs_to_dt_time(sum(int(row[0]) for row in weekly_goal_avgs if row[0] is not None))
         stats['first_day'] = first_day_ts
         return stats
 
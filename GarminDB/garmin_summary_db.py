@@ -66,11 +66,13 @@ class WeeksSummary(GarminSummaryDB.Base, HealthDB.SummaryBase):
 
 class DaysSummary(GarminSummaryDB.Base, HealthDB.SummaryBase):
     __tablename__ = 'days_summary'
-    table_version = 1
+    table_version = 2
     view_version = HealthDB.SummaryBase.view_version
 
     day = Column(Date, primary_key=True)
 
+    __table_args__ = {'sqlite_with_rowid' : False}
+
     time_col_name = 'day'
 
 
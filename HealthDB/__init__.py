@@ -6,6 +6,8 @@ __license__ = "GPL"
 
 import utilities
 import derived_enum as DerivedEnum
+from enum_as_int import EnumAsInt
+from enum_lookup import EnumLookupObject
 from db import DB, DBObject
 from db_version import DbVersionObject
 from summary_base import SummaryBase
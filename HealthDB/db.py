@@ -10,7 +10,7 @@ import datetime
 
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, func, desc, extract, and_
+from sqlalchemy import create_engine, func, desc, extract, and_, case, select
 from sqlalchemy.orm import sessionmaker, synonym, Query
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm.attributes import set_attribute
@@ -190,7 +190,7 @@ class DBObject(object):
 
     @classmethod
     def delete_view(cls, db, view_name=None):
-        cls.__delete_view(db, view_name if view_name is not None else cls.get_default_view_name())
+        cls.__delete_view(db, view_name if view_name is not None else cls._get_default_view_name())
 
     @classmethod
     def __create_view_if_not_exists(cls, session, view_name, query_str):
@@ -208,11 +208,13 @@ class DBObject(object):
             cls.__create_view_if_not_exists(session, view_name, str(query))
 
     @classmethod
-    def create_multi_join_view(cls, db, view_name, selectable, joins, order_by):
+    def create_multi_join_view(cls, db, view_name, selectable, joins, order_by, outer_joins=()):
         with db.managed_session() as session:
             query = Query(selectable, session=session)
             for (join_table, join_clause) in joins:
                 query = query.join(join_table, join_clause)
+            for (join_table, join_clause) in outer_joins:
+                query = query.outerjoin(join_table, join_clause)
             query = query.order_by(order_by)
             cls.__create_view_if_not_exists(session, view_name, str(query))
 
@@ -361,18 +363,28 @@ class DBObject(object):
             return cls._get_days(session, year)
 
     @classmethod
-    def _query(cls, session, selectable, order_by=None, start_ts=None, end_ts=None, ignore_le_zero_col=None):
-        query = session.query(selectable)
-        if order_by is not None:
-            query = query.order_by(order_by)
+    def _query_filters(cls, start_ts=None, end_ts=None, ignore_le_zero_col=None):
+        filters = []
         if start_ts is not None and end_ts is not None:
-            query = query.filter(cls.during(start_ts, end_ts))
+            filters.append(cls.during(start_ts, end_ts))
         elif start_ts is not None:
-            query = query.filter(cls.after(start_ts))
+            filters.append(cls.after(start_ts))
         elif end_ts is not None:
-            query = query.filter(cls.before(end_ts))
+            filters.append(cls.before(end_ts))
         if ignore_le_zero_col is not None:
-            query = query.filter(ignore_le_zero_col > 0)
+            filters.append(ignore_le_zero_col > 0)
+        return filters
+
+    @classmethod
+    def _query(cls, session, selectable, order_by=None, start_ts=None, end_ts=None, ignore_le_zero_col=None):
+        if isinstance(selectable, list):
+            query = session.query(*selectable)
+        else:
+            query = session.query(selectable)
+        if order_by is not None:
+            query = query.order_by(order_by)
+        for query_filter in cls._query_filters(start_ts, end_ts, ignore_le_zero_col):
+            query = query.filter(query_filter)
         return query
 
     @classmethod
@@ -417,9 +429,21 @@ class DBObject(object):
         with db.managed_session() as session:
             return [row[0] for row in cls._get_col_func_query(session, col, func.distinct, start_ts, end_ts).all()]
 
+    @classmethod
+    def _get_col_func_scalar(cls, session, col, stat_func, start_ts=None, end_ts=None, ignore_le_zero=False):
+        """Return an aggregate of a column using a Core select, which skips the ORM Query machinery."""
+        # Query autoflushes pending objects before running, do the same so they are included in the aggregate
+        if session.autoflush:
+            session.flush()
+        query = select([stat_func(col)])
+        query_filters = cls._query_filters(start_ts, end_ts, col if ignore_le_zero else None)
+        if query_filters:
+            query = query.where(and_(*query_filters))
+        return session.execute(query).scalar()
+
     @classmethod
     def _get_col_avg(cls, session, col, start_ts=None, end_ts=None, ignore_le_zero=False):
-        return cls._get_col_func_query(session, col, func.avg, start_ts, end_ts, col if ignore_le_zero else None).scalar()
+        return cls._get_col_func_scalar(session, col, func.avg, start_ts, end_ts, ignore_le_zero)
 
     @classmethod
     def get_col_avg(cls, db, col, start_ts=None, end_ts=None, ignore_le_zero=False):
@@ -428,38 +452,66 @@ class DBObject(object):
 
     @classmethod
     def _get_col_min(cls, session, col, start_ts=None, end_ts=None, ignore_le_zero=False):
-        return cls._get_col_func_query(session, col, func.min, start_ts, end_ts, col if ignore_le_zero else None).scalar()
+        return cls._get_col_func_scalar(session, col, func.min, start_ts, end_ts, ignore_le_zero)
 
     @classmethod
     def get_col_min(cls, db, col, start_ts=None, end_ts=None, ignore_le_zero=False):
         with db.managed_session() as session:
-            return cls._get_col_func_query(session, col, func.min, start_ts, end_ts, col if ignore_le_zero else None).scalar()
+            return cls._get_col_min(session, col, start_ts, end_ts, ignore_le_zero)
 
     @classmethod
     def _get_col_max(cls, session, col, start_ts=None, end_ts=None, ignore_le_zero=False):
-        return cls._get_col_func_query(session, col, func.max, start_ts, end_ts, ignore_le_zero).scalar()
+        return cls._get_col_func_scalar(session, col, func.max, start_ts, end_ts, ignore_le_zero)
 
     @classmethod
     def get_col_max(cls, db, col, start_ts=None, end_ts=None, ignore_le_zero=False):
         with db.managed_session() as session:
-            return cls._get_col_func_query(session, col, func.max, start_ts, end_ts, ignore_le_zero).scalar()
+            return cls._get_col_max(session, col, start_ts, end_ts, ignore_le_zero)
 
     @classmethod
     def _get_col_sum(cls, session, col, start_ts=None, end_ts=None):
-        return cls._get_col_func_query(session, col, func.sum, start_ts, end_ts).scalar()
+        return cls._get_col_func_scalar(session, col, func.sum, start_ts, end_ts)
 
     @classmethod
     def get_col_sum(cls, db, col, start_ts=None, end_ts=None):
         with db.managed_session() as session:
             return cls._get_col_sum(session, col, start_ts, end_ts)
 
+    @classmethod
+    def col_gt_zero(cls, col):
+        """Return a SQL expression that is the column's value if it is greater than zero and NULL otherwise."""
+        return case([(col > 0, col)])
+
+    @classmethod
+    def time_col_func(cls, stat_func):
+        """Return a function that applies a stat function to the non-zero values of a time column."""
+        return lambda col: cls.time_from_secs(stat_func(cls.col_gt_zero(cls.secs_from_time(col))))
+
+    @classmethod
+    def time_from_result(cls, result):
+        """Convert a time string returned by a query to a time object."""
+        return datetime.datetime.strptime(result, '%H:%M:%S').time() if result is not None else datetime.time.min
+
+    @classmethod
+    def _get_stats_bulk(cls, session, aggs, start_ts=None, end_ts=None):
+        """Return a dict of aggregate values computed in a single query from a list of (label, stat function, column) tuples."""
+        selectable = [stat_func(col).label(label) for (label, stat_func, col) in aggs]
+        row = cls._query(session, selectable, None, start_ts, end_ts).one()
+        return {label : row[index] for index, (label, stat_func, col) in enumerate(aggs)}
+
+    @classmethod
+    def get_stats_bulk(cls, db, aggs, start_ts=None, end_ts=None):
+        """Return a dict of aggregate values computed in a single query from a list of (label, stat function, column) tuples."""
+        with db.managed_session() as session:
+            return cls._get_stats_bulk(session, aggs, start_ts, end_ts)
+
     @classmethod
     def _get_time_col_func(cls, session, col, stat_func, start_ts=None, end_ts=None):
         result = (
             cls._query(session, cls.time_from_secs(stat_func(cls.secs_from_time(col))),
                        None, start_ts, end_ts, cls.secs_from_time(col)).scalar()
         )
-        return datetime.datetime.strptime(result, '%H:%M:%S').time() if result is not None else datetime.time.min
+        return cls.time_from_result(result)
 
     @classmethod
     def get_time_col_func(cls, db, col, stat_func, start_ts=None, end_ts=None):
@@ -0,0 +1,35 @@
+"""A column type for storing enums as integers."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+
+class EnumAsInt(TypeDecorator):
+    """Column type that stores an enum as its integer value and returns it as an enum."""
+
+    impl = Integer
+
+    def __init__(self, enum_type, *args, **kwargs):
+        """Return a new column type instance for the given enum type."""
+        super(EnumAsInt, self).__init__(*args, **kwargs)
+        self.enum_type = enum_type
+
+    def process_bind_param(self, value, dialect):
+        """Convert an enum, or the name of an enum member, to an integer."""
+        if value is None:
+            return None
+        if not isinstance(value, self.enum_type):
+            try:
+                value = self.enum_type[value]
+            except KeyError:
+                raise ValueError('%r is not a valid %s' % (value, self.enum_type.__name__))
+        return value.value
+
+    def process_result_value(self, value, dialect):
+        """Convert an integer to an enum."""
+        if value is not None:
+            return self.enum_type(value)
@@ -0,0 +1,24 @@
+"""Objects for tables that map the integer values of an enum to their names."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+from sqlalchemy import Column, Integer, String
+
+
+class EnumLookupObject(object):
+    """Base class for a table that maps the integer values stored by an EnumAsInt column to the enum's names."""
+
+    # overridden by subclasses
+    enum_type = None
+
+    value = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+
+    @classmethod
+    def populate(cls, db):
+        """Add any members of the enum that are not in the table yet."""
+        with db.managed_session() as session:
+            existing = set(value for (value,) in session.query(cls.value))
+            session.add_all([cls(value=member.value, name=member.name) for member in cls.enum_type if member.value not in existing])
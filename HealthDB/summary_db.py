@@ -77,8 +77,9 @@ class DaysSummary(SummaryDB.Base, sb.SummaryBase):
     """Object representing summarized daily health data."""
 
     __tablename__ = 'days_summary'
-    table_version = 1
+    table_version = 2
     view_version = sb.SummaryBase.view_version
 
     day = Column(Date, primary_key=True)
+    __table_args__ = {'sqlite_with_rowid' : False}
     time_col_name = 'day'
@@ -13,6 +13,7 @@ import progressbar
 import Fit.conversions
 import HealthDB
 import GarminDB
+import garmin_db_config_manager as GarminDBConfigManager
 
 
 logger = logging.getLogger(__file__)
@@ -24,13 +25,18 @@ stat_logger.addHandler(logging.FileHandler('stats.txt', 'w'))
 class Analyze(object):
     """Object for analyzing health data from Garmin devices."""
 
-    def __init__(self, db_params_dict, debug):
+    def __init__(self, db_params_dict, debug, overwrite=False):
         self.garmin_db = GarminDB.GarminDB(db_params_dict, debug)
         self.garmin_mon_db = GarminDB.MonitoringDB(db_params_dict, debug)
         self.garmin_sum_db = GarminDB.GarminSummaryDB(db_params_dict, debug)
         self.sum_db = HealthDB.SummaryDB(db_params_dict, debug)
         self.garmin_act_db = GarminDB.ActivitiesDB(db_params_dict, debug)
         self.measurement_system = GarminDB.Attributes.measurements_type(self.garmin_db)
+        # complete week and month summaries that ended before this day are only calculated once, unless overwriting
+        self.overwrite = overwrite
+        self.recalc_cutoff = datetime.datetime.now().date() - datetime.timedelta(GarminDBConfigManager.summary('recalc_days'))
+        # days whose day summary changed in this run, the weeks and months they fall in are recalculated
+        self.changed_days = set()
 
     def __save_summary_stat(self, name, value):
         GarminDB.Summary.set(self.garmin_sum_db, name, value)
@@ -191,6 +197,14 @@ class Analyze(object):
                         GarminDB.IntensityHR._create_or_update_not_none(garmin_sum_session, entry)
                 previous_ts = monitoring.timestamp
 
+    def __day_summary_changed(self, day_date, stats, garmin_sum_session):
+        # like _create_or_update_not_none, only values that are not None are compared
+        day_summary = GarminDB.DaysSummary._find_one(garmin_sum_session, {'day' : day_date})
+        if day_summary is None:
+            return True
+        return any(getattr(day_summary, col_name) != stats[col_name] for col_name in GarminDB.DaysSummary.get_col_names()
+                   if stats.get(col_name) is not None)
+
     def __calculate_day_stats(self, day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
         stats = GarminDB.DailySummary.get_daily_stats(garmin_session, day_date)
         # prefer getting stats from the daily summary.
@@ -210,6 +224,8 @@ class Analyze(object):
         stats.update(GarminDB.Sleep.get_daily_stats(garmin_session, day_date))
         stats.update(GarminDB.Activities.get_daily_stats(garmin_act_session, day_date))
         # save it to the db
+        if self.__day_summary_changed(day_date, stats, garmin_sum_session):
+            self.changed_days.add(day_date)
         GarminDB.DaysSummary._create_or_update_not_none(garmin_sum_session, stats)
         HealthDB.DaysSummary._create_or_update_not_none(sum_session, stats)
 
@@ -220,6 +236,19 @@ class Analyze(object):
             self.__populate_hr_intensity(day_date, garmin_mon_session, garmin_sum_session)
             self.__calculate_day_stats(day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
 
+    def __summary_is_current(self, garmin_summary_table, summary_table, first_day, last_day, garmin_sum_session, sum_session):
+        # Rows for periods that ended before the recalculation window are kept instead of rescanning the daily data, but only if
+        # every day of the period has a day summary and none of them changed in this run. Data added to a period with gaps, like
+        # when the download start date is moved back, or backfilled for days that were already present always gets picked up.
+        if self.overwrite or last_day >= self.recalc_cutoff:
+            return False
+        days = [first_day + datetime.timedelta(day) for day in xrange((last_day - first_day).days + 1)]
+        if not self.changed_days.isdisjoint(days):
+            return False
+        return (GarminDB.DaysSummary._row_count_for_period(garmin_sum_session, first_day, last_day + datetime.timedelta(1)) == len(days) and
+                garmin_summary_table._find_one(garmin_sum_session, {'first_day' : first_day}) is not None and
+                summary_table._find_one(sum_session, {'first_day' : first_day}) is not None)
+
     def __calculate_week_stats(self, day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
         stats = GarminDB.DailySummary.get_weekly_stats(garmin_session, day_date)
         # prefer getting stats from the daily summary.
@@ -245,7 +274,9 @@ class Analyze(object):
     def __calculate_weeks(self, year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
         for week_starting_day in progressbar.progressbar(xrange(1, 365, 7)):
             day_date = datetime.date(year, 1, 1) + datetime.timedelta(week_starting_day - 1)
-            if day_date < datetime.datetime.now().date():
+            if day_date >= datetime.datetime.now().date():
+                continue
+            if not self.__summary_is_current(GarminDB.WeeksSummary, HealthDB.WeeksSummary, day_date, day_date + datetime.timedelta(6), garmin_sum_session, sum_session):
                 self.__calculate_week_stats(day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
 
     def __calculate_month_stats(self, start_day_date, end_day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
@@ -275,7 +306,8 @@ class Analyze(object):
         for month in progressbar.progressbar(months):
             start_day_date = datetime.date(year, month, 1)
             end_day_date = datetime.date(year, month, calendar.monthrange(year, month)[1])
-            self.__calculate_month_stats(start_day_date, end_day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
+            if not self.__summary_is_current(GarminDB.MonthsSummary, HealthDB.MonthsSummary, start_day_date, end_day_date, garmin_sum_session, sum_session):
+                self.__calculate_month_stats(start_day_date, end_day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
 
     def __calculate_year(self, year):
         with self.garmin_db.managed_session() as garmin_session:
@@ -6,18 +6,26 @@ __license__ = "GPL"
 
 import os
 import sys
+import re
 import shutil
+import datetime
 import progressbar
 import logging
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
 
 import Fit
-from file_processor import FileProcessor
 import garmin_db_config_manager as GarminDBConfigManager
 
 
 logger = logging.getLogger(__file__)
 logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 
+_FIT_NAME_RE = re.compile(Fit.file.name_regex)
+
 
 class Copy(object):
     """Class for copying data from a USB mounted Garmin device."""
@@ -30,18 +38,48 @@ class Copy(object):
         if not os.path.isdir(self.device_mount_dir):
             raise RuntimeError('%s not a directory' % self.device_mount_dir)
 
+    @classmethod
+    def __device_files(cls, device_dir, latest):
+        # Directory entries carry the file type, so only 'latest' needs to stat the files.
+        timestamp = datetime.datetime.now() - datetime.timedelta(1)
+        return [
+            entry.path for entry in scandir(device_dir)
+            if entry.is_file() and _FIT_NAME_RE.search(entry.name) and (not latest or datetime.datetime.fromtimestamp(entry.stat().st_ctime) > timestamp)
+        ]
+
+    @classmethod
+    def _needs_copy(cls, src, dst):
+        """Return True if the destination file is missing or differs in size from, or is older than, the source file."""
+        if not os.path.exists(dst):
+            return True
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+        return dst_stat.st_size != src_stat.st_size or dst_stat.st_mtime < src_stat.st_mtime
+
+    def __copy_files(self, file_names, dest_dir):
+        def copy_file(file):
+            dest_file = os.path.join(dest_dir, os.path.basename(file))
+            if self._needs_copy(file, dest_file):
+                shutil.copyfile(file, dest_file)
+        # copies are bound by the device's I/O latency, so overlap them
+        pool = ThreadPool(GarminDBConfigManager.copy_io_workers())
+        try:
+            for _ in progressbar.progressbar(pool.imap_unordered(copy_file, file_names), max_value=len(file_names)):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+
     def copy_activities(self, activities_dir, latest):
         """Copy activites data FIT files from a USB mounted Garmin device to the given directory."""
         device_activities_dir = GarminDBConfigManager.device_activities_dir(self.device_mount_dir)
         logger.info("Copying activities files from %s to %s", device_activities_dir, activities_dir)
-        file_names = FileProcessor.dir_to_files(device_activities_dir, Fit.file.name_regex, latest)
-        for file in progressbar.progressbar(file_names):
-            shutil.copy(file, activities_dir)
+        file_names = self.__device_files(device_activities_dir, latest)
+        self.__copy_files(file_names, activities_dir)
 
     def copy_monitoring(self, monitoring_dir, latest):
         """Copy daily monitoring data FIT files from a USB mounted Garmin device to the given directory."""
         device_monitoring_dir = GarminDBConfigManager.device_monitoring_dir(self.device_mount_dir)
         logger.info("Copying monitoring files from %s to %s", device_monitoring_dir, monitoring_dir)
-        file_names = FileProcessor.dir_to_files(device_monitoring_dir, Fit.file.name_regex, latest)
-        for file in progressbar.progressbar(file_names):
-            shutil.copy(file, monitoring_dir)
+        file_names = self.__device_files(device_monitoring_dir, latest)
+        self.__copy_files(file_names, monitoring_dir)
@@ -1,5 +1,7 @@
 """Class for downloading health data from Garmin Connect."""
 
+from __future__ import print_function
+
 __author__ = "Tom Goetz"
 __copyright__ = "Copyright Tom Goetz"
 __license__ = "GPL"
@@ -10,11 +12,30 @@ import re
 import logging
 import datetime
 import time
+import threading
 import tempfile
 import zipfile
-import json
+import itertools
+try:
+    from http.cookiejar import LWPCookieJar
+except ImportError:
+    from cookielib import LWPCookieJar
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    # urllib3 can only decode brotli responses when the brotli package is installed
+    import brotli
+    _ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    _ACCEPT_ENCODING = 'gzip, deflate'
 import progressbar
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
 
 import Fit.conversions as conversions
 from garmin_connect_config_manager import GarminConnectConfigManager
@@ -26,6 +47,15 @@ logger = logging.getLogger(__file__)
 logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 root_logger = logging.getLogger()
 
+_CSRF_RE = re.compile(r"name=\"_csrf\" value=\"(\w*)", re.M)
+_TICKET_RE = re.compile(r"\?ticket=([\w-]*)", re.M)
+_JSON_KEY_RES = {}
+_FILENAME_UNSAFE_RE = re.compile(r"[^\w.@-]")
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_MS_PER_DAY = 86400000
+# request pacing must not jump with wall clock changes, time.monotonic is only available on Python 3
+_monotonic = getattr(time, 'monotonic', time.time)
+
 
 class Download(object):
     """Class for downloading health data from Garmin Connect."""
@@ -59,34 +89,115 @@ class Download(object):
     garmin_connect_usersummary_url = garmin_connect_modern_proxy + "/usersummary-service/usersummary"
     garmin_connect_daily_summary_url = garmin_connect_usersummary_url + "/daily/"
 
+    # zip files are already compressed, don't ask for them to be compressed again
+    zip_headers = {'Accept-Encoding' : 'identity'}
+
     def __init__(self):
         """Create a new Download class instance."""
         self.temp_dir = tempfile.mkdtemp()
         logger.debug("__init__: temp_dir= " + self.temp_dir)
         self.session = requests.session()
+        # keep alive connections for the download threads and back off on throttling and server errors,
+        # a throttled (429) request is retried after the wait Garmin Connect asks for in its Retry-After header
+        retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retries)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept-Encoding': _ACCEPT_ENCODING, 'Connection': 'keep-alive'})
         self.sso_rest_client = RestClient(self.session, self.garmin_sso_base_url)
         self.rest_client = RestClient(self.session, self.garmin_connect_modern_url)
         self.activity_service_rest_client = RestClient.inherit(self.rest_client, self.garmin_connect_activity_service)
         self.download_service_rest_client = RestClient.inherit(self.rest_client, self.garmin_connect_download_service)
         self.gc_gonfig = GarminConnectConfigManager()
+        self.username = self.gc_gonfig.get_user()
         self.download_days_overlap = self.gc_gonfig.download_days_overlap()
-
-    def __get_json(self, page_html, key):
-        found = re.search(key + r" = JSON.parse\(\"(.*)\"\);", page_html, re.M)
+        self.download_workers = GarminDBConfigManager.download_workers()
+        self.request_interval = GarminDBConfigManager.download_request_interval()
+        self.pace_lock = threading.Lock()
+        self.next_request_time = 0
+
+    def __get_json(self, page_bytes, key):
+        json_key_re = _JSON_KEY_RES.get(key)
+        if json_key_re is None:
+            json_key_re = re.compile(re.escape(key.encode('ascii')) + br" = JSON.parse\(\"(.*)\"\);", re.M)
+            _JSON_KEY_RES[key] = json_key_re
+        # match and unescape the raw page bytes, the JSON parser takes bytes directly
+        found = json_key_re.search(page_bytes)
         if found:
-            json_text = found.group(1).replace('\\"', '"')
-            return json.loads(json_text)
+            return RestClient.json_loads(found.group(1).replace(b'\\"', b'"'))
+
+    def __load_cookies(self, cookie_file):
+        try:
+            if time.time() - os.path.getmtime(cookie_file) > GarminDBConfigManager.download_cookie_ttl():
+                return False
+            cookie_jar = LWPCookieJar(cookie_file)
+            # session cookies are marked to be discarded, but are what keeps the login
+            cookie_jar.load(ignore_discard=True)
+            self.session.cookies.update(cookie_jar)
+            return True
+        except Exception as e:
+            logger.debug("Failed to load cookies from %s: %s", cookie_file, e)
+            return False
+
+    def __save_cookies(self, cookie_file):
+        try:
+            cookie_jar = LWPCookieJar(cookie_file)
+            for cookie in self.session.cookies:
+                cookie_jar.set_cookie(cookie)
+            # the cookies are login credentials, keep them readable by the owner only
+            with os.fdopen(os.open(cookie_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+                file.write("#LWP-Cookies-2.0\n")
+                file.write(cookie_jar.as_lwp_str(ignore_discard=True))
+        except Exception as e:
+            logger.warning("Failed to save cookies to %s: %s", cookie_file, e)
+
+    def __process_home_page(self, response, profile_dir):
+        self.user_prefs = self.__get_json(response.content, 'VIEWER_USERPREFERENCES')
+        self.social_profile = self.__get_json(response.content, 'VIEWER_SOCIAL_PROFILE')
+        if self.user_prefs is None or self.social_profile is None:
+            return False
+        if profile_dir:
+            self.rest_client.save_json_to_file(os.path.join(profile_dir, 'profile.json'), self.user_prefs)
+        self.display_name = self.user_prefs['displayName']
+        # the per user URLs are used for every day downloaded, so build them once
+        self.daily_summary_url = self.garmin_connect_daily_summary_url + self.display_name
+        self.sleep_daily_url = '%s/%s' % (self.garmin_connect_sleep_daily_url, self.display_name)
+        self.rhr_url = '%s/%s' % (self.garmin_connect_rhr, self.display_name)
+        self.full_name = self.social_profile['fullName']
+        root_logger.info("login: %s (%s)", self.full_name, self.display_name)
+        return True
+
+    def __resume_session(self, cookie_file, profile_dir):
+        # cookies saved by a recent run are still logged in, so skip the SSO round trips
+        if self.__load_cookies(cookie_file):
+            try:
+                response = self.rest_client.get('')
+                if response.status_code == 200 and self.__process_home_page(response, profile_dir):
+                    logger.debug("login: reused saved session")
+                    return True
+            except requests.exceptions.RequestException as e:
+                logger.debug("login: saved session check failed: %s", e)
+        # an expired session lands on the sign in page, drop the saved cookies and start over with a clean cookie jar
+        self.session.cookies.clear()
+        try:
+            os.remove(cookie_file)
+        except OSError:
+            pass
+        return False
 
     def login(self):
         """Login to Garmin Connect."""
         profile_dir = GarminDBConfigManager.get_or_create_fit_files_dir()
-        username = self.gc_gonfig.get_user()
+        # the saved session belongs to one account, so a changed username does not resume it
+        cookie_file = os.path.join(profile_dir, 'cookies_%s.lwp' % _FILENAME_UNSAFE_RE.sub('_', self.username or ''))
+        if self.username and self.__resume_session(cookie_file, profile_dir):
+            return True
         password = self.gc_gonfig.get_password()
-        if not username or not password:
-            print "Missing config: need username and password. Edit GarminConnectConfig.json."
+        if not self.username or not password:
+            print("Missing config: need username and password. Edit GarminConnectConfig.json.")
             return
 
-        logger.debug("login: %s %s", username, password)
+        logger.debug("login: %s %s", self.username, password)
         get_headers = {
             'Referer'                           : self.garmin_connect_login_url
         }
@@ -126,7 +237,7 @@ class Download(object):
             logger.error("Login get failed (%d).", response.status_code)
             self.__save_binary_file('login_get.html', response)
             return False
-        found = re.search(r"name=\"_csrf\" value=\"(\w*)", response.text, re.M)
+        found = _CSRF_RE.search(response.text)
         if not found:
             logger.error("_csrf not found.", response.status_code)
             self.__save_binary_file('login_get.html', response)
@@ -134,7 +245,7 @@ class Download(object):
         logger.debug("_csrf found (%s).", found.group(1))
 
         data = {
-            'username'  : username,
+            'username'  : self.username,
             'password'  : password,
             'embed'     : 'false',
             '_csrf'     : found.group(1)
@@ -144,7 +255,7 @@ class Download(object):
             'Content-Type'  : 'application/x-www-form-urlencoded'
         }
         response = self.sso_rest_client.post(self.garmin_connect_sso_login, post_headers, params, data)
-        found = re.search(r"\?ticket=([\w-]*)", response.text, re.M)
+        found = _TICKET_RE.search(response.text)
         if not found:
             logger.error("Login ticket not found (%d).", response.status_code)
             self.__save_binary_file('login_post.html', response)
@@ -158,84 +269,140 @@ class Download(object):
             logger.error("Login get homepage failed (%d).", response.status_code)
             self.__save_binary_file('login_home.html', response)
             return False
-        self.user_prefs = self.__get_json(response.text, 'VIEWER_USERPREFERENCES')
-        if profile_dir:
-            self.rest_client.save_json_to_file(profile_dir + "/profile.json", self.user_prefs)
-        self.display_name = self.user_prefs['displayName']
-        self.social_profile = self.__get_json(response.text, 'VIEWER_SOCIAL_PROFILE')
-        self.full_name = self.social_profile['fullName']
-        root_logger.info("login: %s (%s)", self.full_name, self.display_name)
+        if not self.__process_home_page(response, profile_dir):
+            logger.error("Login user preferences or social profile not found.")
+            self.__save_binary_file('login_home.html', response)
+            return False
+        self.__save_cookies(cookie_file)
         return True
 
     def __save_binary_file(self, filename, response):
-        with open(filename, 'wb') as file:
-            for chunk in response:
-                file.write(chunk)
+        with open(filename, 'wb', 1 << 20) as file:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                if chunk:
+                    file.write(chunk)
 
     def unzip_files(self, outdir):
         """Unzip and downloaded zipped files into the directory supplied."""
+        def unzip_file(filename):
+            with open(os.path.join(self.temp_dir, filename), 'rb', 1 << 20) as file:
+                with zipfile.ZipFile(file, 'r') as files_zip:
+                    files_zip.extractall(outdir)
         logger.info("unzip_files: " + outdir)
-        for filename in os.listdir(self.temp_dir):
-            match = re.search(r'.*\.zip', filename)
-            if match:
-                files_zip = zipfile.ZipFile(self.temp_dir + "/" + filename, 'r')
-                files_zip.extractall(outdir)
-                files_zip.close()
-
-    def __get_stat(self, stat_function, directory, date, days, overwite):
-        for day in progressbar.progressbar(xrange(0, days + 1)):
-            download_date = date + datetime.timedelta(days=day)
+        # extraction is disk bound and zlib releases the GIL, so unzip the files in parallel
+        pool = ThreadPool(multiprocessing.cpu_count())
+        try:
+            pool.map(unzip_file, [filename for filename in os.listdir(self.temp_dir) if filename.endswith('.zip')])
+        finally:
+            pool.close()
+            pool.join()
+
+    def __pace(self):
+        # space out the starts of requests from all download threads by at least the request interval,
+        # only sleeping for what is left of the interval after the time the previous request took
+        with self.pace_lock:
+            now = _monotonic()
+            delay = self.next_request_time - now
+            self.next_request_time = max(now, self.next_request_time) + self.request_interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def __imap_results(self, imap_results):
+        # waiting on a result without a timeout can not be interrupted with Ctrl-C on Python 2
+        while True:
+            try:
+                result = imap_results.next(1)
+            except multiprocessing.TimeoutError:
+                continue
+            except StopIteration:
+                return
+            yield result
+
+    def __download_concurrently(self, download_function, items, count, stop_on_failure=False):
+        """Run download_function on the items in the download threads, returning the index of the first failed item if stop_on_failure."""
+        pool = ThreadPool(self.download_workers)
+        try:
+            if stop_on_failure:
+                # only queue one item per worker at a time, so after a failure nothing past the items already in flight is requested
+                windows = (items[start:start + self.download_workers] for start in range(0, len(items), self.download_workers))
+                results = itertools.chain.from_iterable(self.__imap_results(pool.imap(download_function, window)) for window in windows)
+            else:
+                results = self.__imap_results(pool.imap(download_function, items))
+            # results come back in order, so a failure stops the download at the same item a sequential download would
+            for index, result in enumerate(progressbar.progressbar(results, max_value=count)):
+                if stop_on_failure and not result:
+                    return index
+        finally:
+            # requests already in flight are allowed to finish
+            pool.terminate()
+            pool.join()
+
+    def __get_stat(self, stat_function, directory, date, days, overwite, json_file_prefix):
+        def get_day(download_date_and_str):
+            (download_date, date_str) = download_date_and_str
             # always overight for yesterday and today since the last download may have been a partial result
-            delta = datetime.datetime.now().date() - download_date
-            if not stat_function(directory, download_date, overwite or delta.days <= self.download_days_overlap):
-                break
-            # pause for a second between every page access
-            time.sleep(1)
-
-    def __get_summary_day(self, directory, date, overwite=False):
-        root_logger.info("get_summary_day: %s", date)
-        date_str = date.strftime('%Y-%m-%d')
+            overwite_day = overwite or download_date >= overwite_after
+            # skip days that were already downloaded without pacing or building the request
+            if not overwite_day and '%s%s.json' % (json_file_prefix, date_str) in existing_files:
+                return True
+            self.__pace()
+            return stat_function(directory, download_date, date_str, overwite_day)
+        overwite_after = datetime.datetime.now().date() - datetime.timedelta(days=self.download_days_overlap)
+        existing_files = frozenset(entry.name for entry in scandir(directory) if entry.is_file())
+        # format each date string once, isoformat is the same YYYY-MM-DD string strftime produced
+        download_dates = [(download_date, download_date.isoformat())
+                          for download_date in (date + datetime.timedelta(days=day) for day in range(0, days + 1))]
+        failed_index = self.__download_concurrently(get_day, download_dates, len(download_dates), stop_on_failure=True)
+        if failed_index is not None:
+            # Days after the failed one may have been downloaded along with it. Discard the files they added, so the downloaded
+            # days have no gap and the next --latest download starts again at the failed day.
+            for (download_date, date_str) in download_dates[failed_index + 1:]:
+                json_filename = '%s%s.json' % (json_file_prefix, date_str)
+                if json_filename not in existing_files and os.path.isfile(os.path.join(directory, json_filename)):
+                    os.remove(os.path.join(directory, json_filename))
+
+    def __get_summary_day(self, directory, date, date_str, overwite=False):
+        root_logger.info("get_summary_day: %s", date_str)
         params = {
             'calendarDate' : date_str,
-            '_'         : str(conversions.dt_to_epoch_ms(conversions.date_to_dt(date)))
+            '_'         : str((date.toordinal() - _EPOCH_ORDINAL) * _MS_PER_DAY)
         }
-        url = self.garmin_connect_daily_summary_url + self.display_name
-        return self.rest_client.download_json_file(url, params, directory + '/daily_summary_' + date_str, overwite)
+        return self.rest_client.download_json_file(self.daily_summary_url, params, os.path.join(directory, 'daily_summary_%s' % date_str), overwite)
 
     def get_daily_summaries(self, directory, date, days, overwite):
         """Download the daily summary data from Garmin Connect and save to a JSON file."""
         root_logger.info("Geting daily summaries: %s (%d)", date, days)
-        self.__get_stat(self.__get_summary_day, directory, date, days, overwite)
+        self.__get_stat(self.__get_summary_day, directory, date, days, overwite, 'daily_summary_')
 
     def __get_monitoring_day(self, date):
         root_logger.info("get_monitoring_day: %s", date)
-        response = self.download_service_rest_client.get('wellness/' + date.strftime("%Y-%m-%d"))
+        date_str = date.isoformat()
+        response = self.download_service_rest_client.get('wellness/%s' % date_str, self.zip_headers, stream=True)
         if response and response.status_code == 200:
-            self.__save_binary_file(self.temp_dir + '/' + str(date) + '.zip', response)
+            self.__save_binary_file(os.path.join(self.temp_dir, '%s.zip' % date_str), response)
 
     def get_monitoring(self, date, days):
         """Download the daily monitoring data from Garmin Connect, unzip and save the raw files."""
-        root_logger.info("Geting monitoring: %s (%d)", date, days)
-        for day in progressbar.progressbar(xrange(0, days + 1)):
-            day_date = date + datetime.timedelta(day)
+        def get_day(day_date):
+            self.__pace()
             self.__get_monitoring_day(day_date)
-            # pause for a second between every page access
-            time.sleep(1)
+        root_logger.info("Geting monitoring: %s (%d)", date, days)
+        day_dates = [date + datetime.timedelta(day) for day in range(0, days + 1)]
+        self.__download_concurrently(get_day, day_dates, len(day_dates))
 
-    def __get_weight_day(self, directory, day, overwite=False):
-        root_logger.info("Checking weight: %s overwite %r", day, overwite)
-        date_str = day.strftime('%Y-%m-%d')
+    def __get_weight_day(self, directory, day, date_str, overwite=False):
+        root_logger.info("Checking weight: %s overwite %r", date_str, overwite)
         params = {
             'startDate' : date_str,
             'endDate'   : date_str,
-            '_'         : str(conversions.dt_to_epoch_ms(conversions.date_to_dt(day)))
+            '_'         : str((day.toordinal() - _EPOCH_ORDINAL) * _MS_PER_DAY)
         }
-        return self.rest_client.download_json_file(self.garmin_connect_weight_url, params, directory + '/weight_' + date_str, overwite)
+        return self.rest_client.download_json_file(self.garmin_connect_weight_url, params, os.path.join(directory, 'weight_%s' % date_str), overwite)
 
     def get_weight(self, directory, date, days, overwite):
         """Download the sleep data from Garmin Connect and save to a JSON file."""
         root_logger.info("Geting weight: %s (%d)", date, days)
-        self.__get_stat(self.__get_weight_day, directory, date, days, overwite)
+        self.__get_stat(self.__get_weight_day, directory, date, days, overwite, 'weight_')
 
     def __get_activity_summaries(self, start, count):
         root_logger.info("get_activity_summaries")
@@ -249,63 +416,66 @@ class Download(object):
 
     def __save_activity_details(self, directory, activity_id_str, overwite):
         root_logger.debug("save_activity_details")
-        json_filename = directory + '/activity_details_' + activity_id_str
+        json_filename = os.path.join(directory, 'activity_details_%s' % activity_id_str)
         return self.activity_service_rest_client.download_json_file(activity_id_str, None, json_filename, overwite)
 
     def __save_activity_file(self, activity_id_str):
         root_logger.debug("save_activity_file: " + activity_id_str)
-        response = self.download_service_rest_client.get('activity/' + activity_id_str)
+        response = self.download_service_rest_client.get('activity/%s' % activity_id_str, self.zip_headers, stream=True)
         if response.status_code == 200:
-            self.__save_binary_file(self.temp_dir + '/activity_' + activity_id_str + '.zip', response)
+            self.__save_binary_file(os.path.join(self.temp_dir, 'activity_%s.zip' % activity_id_str), response)
         else:
             root_logger.error("save_activity_file: %s failed (%d): %s", response.url, response.status_code, response.text)
 
     def get_activities(self, directory, count, overwite=False):
         """Download activities files from Garmin Connect and save the raw files."""
-        logger.info("Geting activities: '%s' (%d)", directory, count)
-        activities = self.__get_activity_summaries(0, count)
-        for activity in progressbar.progressbar(activities):
+        def get_activity(activity):
             activity_id_str = str(activity['activityId'])
             activity_name_str = conversions.printable(activity['activityName'])
             root_logger.info("get_activities: %s (%s)" % (activity_name_str, activity_id_str))
-            json_filename = directory + '/activity_' + activity_id_str + '.json'
-            if not os.path.isfile(json_filename) or overwite:
+            json_basename = 'activity_%s.json' % activity_id_str
+            json_filename = os.path.join(directory, json_basename)
+            if json_basename not in existing_files or overwite:
                 root_logger.info("get_activities: %s <- %r" % (json_filename, activity))
+                self.__pace()
                 self.__save_activity_details(directory, activity_id_str, overwite)
                 self.rest_client.save_json_to_file(json_filename, activity)
-                if not os.path.isfile(directory + '/' + activity_id_str + '.fit') or overwite:
+                if '%s.fit' % activity_id_str not in existing_files or overwite:
+                    self.__pace()
                     self.__save_activity_file(activity_id_str)
-                # pause for a second between every page access
-                time.sleep(1)
+        logger.info("Geting activities: '%s' (%d)", directory, count)
+        activities = self.__get_activity_summaries(0, count)
+        # one directory read instead of stat calls for every activity
+        existing_files = frozenset(entry.name for entry in scandir(directory) if entry.is_file())
+        self.__download_concurrently(get_activity, activities, len(activities))
 
     def get_activity_types(self, directory, overwite):
         """Download the activity types from Garmin Connect and save to a JSON file."""
         root_logger.info("get_activity_types: '%s'", directory)
-        return self.activity_service_rest_client.download_json_file('activityTypes', None, directory + '/activity_types', overwite)
+        return self.activity_service_rest_client.download_json_file('activityTypes', None, os.path.join(directory, 'activity_types'), overwite)
 
-    def __get_sleep_day(self, directory, date, overwite=False):
-        json_filename = directory + '/sleep_' + str(date)
+    def __get_sleep_day(self, directory, date, date_str, overwite=False):
+        json_filename = os.path.join(directory, 'sleep_%s' % date_str)
         params = {
-            'date' : date.strftime("%Y-%m-%d")
+            'date' : date_str
         }
-        return self.rest_client.download_json_file(self.garmin_connect_sleep_daily_url + '/' + self.display_name, params, json_filename, overwite)
+        return self.rest_client.download_json_file(self.sleep_daily_url, params, json_filename, overwite)
 
     def get_sleep(self, directory, date, days, overwite):
         """Download the sleep data from Garmin Connect and save to a JSON file."""
         root_logger.info("Geting sleep: %s (%d)", date, days)
-        self.__get_stat(self.__get_sleep_day, directory, date, days, overwite)
+        self.__get_stat(self.__get_sleep_day, directory, date, days, overwite, 'sleep_')
 
-    def __get_rhr_day(self, directory, day, overwite=False):
-        date_str = day.strftime('%Y-%m-%d')
-        json_filename = directory + '/rhr_' + date_str
+    def __get_rhr_day(self, directory, day, date_str, overwite=False):
+        json_filename = os.path.join(directory, 'rhr_%s' % date_str)
         params = {
             'fromDate'  : date_str,
             'untilDate' : date_str,
             'metricId'  : 60
         }
-        return self.rest_client.download_json_file(self.garmin_connect_rhr + '/' + self.display_name, params, json_filename, overwite)
+        return self.rest_client.download_json_file(self.rhr_url, params, json_filename, overwite)
 
     def get_rhr(self, directory, date, days, overwite):
         """Download the resting heart rate data from Garmin Connect and save to a JSON file."""
         root_logger.info("Geting rhr: %s (%d)", date, days)
-        self.__get_stat(self.__get_rhr_day, directory, date, days, overwite)
+        self.__get_stat(self.__get_rhr_day, directory, date, days, overwite, 'rhr_')
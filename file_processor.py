@@ -18,13 +18,13 @@ class FileProcessor(object):
 
     @classmethod
     def __regex_matches_file(cls, file, file_regex):
-        return re.search(file_regex, file)
+        return file_regex.search(file)
 
     @classmethod
     def match_file(cls, input_file, file_regex):
         """Test if a file matches a regex."""
         logger.info("Matching file: " + input_file)
-        if cls.__regex_matches_file(input_file, file_regex):
+        if cls.__regex_matches_file(input_file, re.compile(file_regex)):
             return [input_file]
         return []
 
@@ -34,8 +34,10 @@ class FileProcessor(object):
 
     @classmethod
     def dir_to_files(cls, input_dir, file_regex, latest=False, recursive=False):
-        """Search a directory, p[ossibly recursively, and return a list of all files matching a regex."""
-        logger.debug("Reading directory: %s looking for %s", input_dir, file_regex)
+        """Search a directory, p[ossibly recursively, and return a list of all files matching a regex string or compiled pattern."""
+        # compiling an already compiled pattern returns it unchanged
+        file_regex = re.compile(file_regex)
+        logger.debug("Reading directory: %s looking for %s", input_dir, file_regex.pattern)
         file_names = []
         timestamp = datetime.datetime.now() - datetime.timedelta(1)
         for file in os.listdir(input_dir):
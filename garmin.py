@@ -196,10 +196,10 @@ def import_data(debug, test, latest, weight, monitoring, sleep, rhr, activities)
             gfd.process_files(db_params_dict)
 
 
-def analyze_data(debug):
+def analyze_data(debug, overwite):
     """Analyze the downloaded and imported Garmin data and create summary tables."""
     db_params_dict = GarminDBConfigManager.get_db_params()
-    analyze = Analyze(db_params_dict, debug - 1)
+    analyze = Analyze(db_params_dict, debug - 1, overwite)
     analyze.get_stats()
     analyze.summary()
 
@@ -231,7 +231,7 @@ def print_usage(program, error=None):
     print '    --import     : Import data for the chosen stats.'
     print '    --analyze    : Analyze data in the db and create summary and derived tables.'
     print '    --latest     : Only download and/or import the latest data.'
-    print '    --overwrite  : Overwite existing files when downloading. The default is to only download missing files.'
+    print '    --overwrite  : Overwite existing files when downloading and recalculate all week and month summaries when analyzing. The default is to only download missing files.'
     print '    --delete_db  : Delete Garmin DB db files.'
     print '    --trace      : Turn on debug tracing. Extra logging will be written to log file.'
     print '    '
@@ -337,7 +337,7 @@ def main(argv):
         import_data(debug, test, latest, weight, monitoring, sleep, rhr, activities)
 
     if _analyze_data:
-        analyze_data(debug)
+        analyze_data(debug, overwite)
 
 
 if __name__ == "__main__":
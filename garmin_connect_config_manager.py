@@ -1,5 +1,7 @@
 """Class that manages Garmin Connect download config."""
 
+from __future__ import print_function
+
 __author__ = "Tom Goetz"
 __copyright__ = "Copyright Tom Goetz"
 __license__ = "GPL"
@@ -19,16 +21,16 @@ class GarminConnectConfigManager(object):
     def __init__(self):
         """Return a new GarminConnectConfigManager instance."""
         def parser(entry):
-            for (entry_key, entry_value) in entry.iteritems():
+            for (entry_key, entry_value) in entry.items():
                 if str(entry_value).endswith('_date'):
                     entry[entry_key] = dateutil.parser.parse(entry_value)
             return entry
         try:
             self.config = json.load(open(self.config_filename), object_hook=parser)
         except Exception as e:
-            print str(e)
-            print "Missing config: copy GarminConnectConfig.json.example to GarminConnectConfig.json and edit GarminConnectConfig.json to " + \
-                  "add your Garmin Connect username and password."
+            print(str(e))
+            print("Missing config: copy GarminConnectConfig.json.example to GarminConnectConfig.json and edit GarminConnectConfig.json to " +
+                  "add your Garmin Connect username and password.")
             sys.exit(-1)
 
     def get_secure_password(self):
@@ -37,7 +39,7 @@ class GarminConnectConfigManager(object):
         if system == 'Darwin':
             password = subprocess.check_output(["security", "find-internet-password", "-s", "sso.garmin.com", "-w"])
             if password:
-                return password.rstrip()
+                return password.decode('utf-8').rstrip()
 
     def get_user(self):
         """Return the Garmin Connect username."""
@@ -45,9 +47,13 @@ class GarminConnectConfigManager(object):
 
     def get_password(self):
         """Return the Garmin Connect password."""
-        password = self.config['credentials']['password']
+        # looking the password up in secure storage runs a subprocess, so only do it once
+        password = getattr(self, '_password', None)
         if not password:
-            password = self.get_secure_password()
+            password = self.config['credentials']['password']
+            if not password:
+                password = self.get_secure_password()
+            self._password = password
         return password
 
     def latest_activity_count(self):
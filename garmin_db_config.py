@@ -42,6 +42,14 @@ class GarminDBConfig(object):
         'activities'            : 'ACTIVITY',
         'monitoring'            : 'MONITOR'
     }
+    copy = {
+        'io_workers'            : 4
+    }
+    download = {
+        'workers'               : 4,
+        'request_interval'      : 1.0,
+        'cookie_ttl_hours'      : 12
+    }
     graphs = {
         'steps'                 : {'period' : 'weeks', 'days' : 730},
         'hr'                    : {'period' : 'weeks', 'days' : 730},
@@ -51,3 +59,6 @@ class GarminDBConfig(object):
     checkup = {
         'look_back_days'        : 90
     }
+    summary = {
+        'recalc_days'           : 90
+    }
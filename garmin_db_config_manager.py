@@ -151,6 +151,26 @@ def device_activities_dir(mount_dir):
     return mount_dir + os.sep + GarminDBConfig.device_directories['base'] + os.sep + GarminDBConfig.device_directories['activities']
 
 
+def copy_io_workers():
+    """Return the number of threads to use when copying files from a USB mounted device."""
+    return GarminDBConfig.copy['io_workers']
+
+
+def download_workers():
+    """Return the number of threads to use when downloading from Garmin Connect."""
+    return GarminDBConfig.download['workers']
+
+
+def download_request_interval():
+    """Return the minimum number of seconds between the starts of two Garmin Connect requests."""
+    return GarminDBConfig.download['request_interval']
+
+
+def download_cookie_ttl():
+    """Return the number of seconds saved Garmin Connect session cookies are reused for."""
+    return GarminDBConfig.download['cookie_ttl_hours'] * 3600
+
+
 def graphs_activity(activity):
     """Return a dictionary of graph config items for a given activity."""
     return GarminDBConfig.graphs.get(activity)
@@ -165,3 +185,8 @@ def graphs_activity_config(activity, key):
 def checkup(item):
     """Return an item from the checkup config."""
     return GarminDBConfig.checkup.get(item)
+
+
+def summary(item):
+    """Return an item from the summary config."""
+    return GarminDBConfig.summary.get(item)
@@ -7,6 +7,10 @@ __license__ = "GPL"
 import os
 import logging
 import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 logger = logging.getLogger(__file__)
@@ -39,11 +43,11 @@ class RestClient(object):
     def __build_url(self, leaf_route):
         return '%s/%s' % (self.base_route, leaf_route)
 
-    def get(self, leaf_route, aditional_headers={}, params={}):
-        """Make a REST API call using the GET method."""
+    def get(self, leaf_route, aditional_headers={}, params={}, stream=False):
+        """Make a REST API call using the GET method. If stream is True the body is read as the response is consumed."""
         total_headers = self.default_headers.copy()
         total_headers.update(aditional_headers)
-        response = self.session.get(self.__build_url(leaf_route), headers=total_headers, params=params)
+        response = self.session.get(self.__build_url(leaf_route), headers=total_headers, params=params, stream=stream)
         logger.info("get: %s (%d)", response.url, response.status_code)
         return response
 
@@ -55,14 +59,25 @@ class RestClient(object):
         logger.info("post: %s (%d)", response.url, response.status_code)
         return response
 
+    @classmethod
+    def json_loads(cls, json_text):
+        """Parse JSON text or bytes, using orjson when it is installed."""
+        if orjson is not None:
+            return orjson.loads(json_text)
+        return json.loads(json_text)
+
     def __convert_to_json(self, object):
         return object.__str__()
 
     def save_json_to_file(self, json_full_filename, json_data):
         """Save JSON formatted data to a file."""
-        with open(json_full_filename, 'w') as file:
+        if orjson is not None:
+            json_bytes = orjson.dumps(json_data, default=self.__convert_to_json)
+        else:
+            json_bytes = json.dumps(json_data, default=self.__convert_to_json).encode('utf-8')
+        with open(json_full_filename, 'wb') as file:
             logger.info("save_json_to_file: %s", json_full_filename)
-            file.write(json.dumps(json_data, default=self.__convert_to_json))
+            file.write(json_bytes)
 
     def download_json_file(self, leaf_route, params, json_filename, overwite):
         """Download JSON formatted data from a REST API and save it to a file."""
@@ -74,7 +89,7 @@ class RestClient(object):
             if response.status_code != 200:
                 logger.error("GET %s failed (%d): %s", response.url, response.status_code, response.text)
                 return False
-            self.save_json_to_file(json_full_filname, response.json())
+            self.save_json_to_file(json_full_filname, self.json_loads(response.content))
         else:
             logger.info("Ignoring %s (exists)", json_filename)
         return True
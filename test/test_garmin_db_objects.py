@@ -9,8 +9,9 @@ __license__ = "GPL"
 import unittest
 import logging
 import sys
+import datetime
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import StatementError
 
 sys.path.append('../.')
 
@@ -66,13 +67,64 @@ class TestGarminDbObjects(unittest.TestCase):
         filename_with_path = '/test/directory/' + filename
         file_type = 'xxxxx'
         file_serial_number = 987654321
-        with self.assertRaises(IntegrityError):
+        with self.assertRaises(StatementError):
             self.check_file_obj(filename_with_path, file_type, file_serial_number)
 
+    def test_files_view(self):
+        garmindb = GarminDB.GarminDB(self.db_params_dict)
+        serial_number = 123456789
+        GarminDB.Device.find_or_create(garmindb, {
+            'serial_number' : serial_number,
+            'timestamp'     : datetime.datetime(2019, 1, 1),
+            'manufacturer'  : GarminDB.Device.Manufacturer.Unknown,
+            'product'       : 'test_product',
+        })
+        GarminDB.File.find_or_create(garmindb, {
+            'id'            : '23456789',
+            'name'          : '23456789.fit',
+            'type'          : GarminDB.File.FileType.tcx,
+            'serial_number' : serial_number,
+        })
+        GarminDB.DeviceInfo.find_or_create(garmindb, {
+            'timestamp'     : datetime.datetime(2019, 1, 1),
+            'file_id'       : '23456789',
+            'serial_number' : serial_number,
+            'device_type'   : 'test_device',
+        })
+        with garmindb.managed_session() as session:
+            files_row = session.execute("SELECT type, manufacturer, product FROM files_view WHERE activity_id = '23456789'").fetchone()
+            device_info_row = session.execute("SELECT manufacturer, product FROM device_info_view WHERE file_id = '23456789'").fetchone()
+        self.assertEqual(tuple(files_row), ('tcx', 'Unknown', 'test_product'))
+        self.assertEqual(tuple(device_info_row), ('Unknown', 'test_product'))
+
+    def test_col_max_includes_pending(self):
+        garmindb = GarminDB.GarminDB(self.db_params_dict)
+        with garmindb.managed_session() as session:
+            session.add(GarminDB.Weight(day=datetime.date(2019, 3, 1), weight=150.0))
+            session.add(GarminDB.Weight(day=datetime.date(2019, 3, 2), weight=250.0))
+            self.assertEqual(GarminDB.Weight._get_col_max(session, GarminDB.Weight.weight), 250.0)
+
     def test_file_type(self):
         file_types_list = list(GarminDB.File.FileType)
         self.assertIn(GarminDB.File.FileType.convert(Fit.field_enums.FileType.goals), file_types_list)
 
+    def test_measurements_type(self):
+        garmindb = GarminDB.GarminDB(self.db_params_dict)
+        GarminDB.Attributes.set(garmindb, 'measurement_system', str(Fit.field_enums.DisplayMeasure.metric))
+        self.assertEqual(GarminDB.Attributes.measurements_type(garmindb), Fit.field_enums.DisplayMeasure.metric)
+        GarminDB.Attributes.set(garmindb, 'measurement_system', str(Fit.field_enums.DisplayMeasure.statute))
+        self.assertEqual(GarminDB.Attributes.measurements_type(garmindb), Fit.field_enums.DisplayMeasure.statute)
+
+
+    def test_measurements_type_session_set_newer(self):
+        garmindb = GarminDB.GarminDB(self.db_params_dict)
+        GarminDB.Attributes.set(garmindb, 'measurement_system', str(Fit.field_enums.DisplayMeasure.statute), datetime.datetime(2019, 1, 1))
+        self.assertEqual(GarminDB.Attributes.measurements_type(garmindb), Fit.field_enums.DisplayMeasure.statute)
+        # the importers set attributes through their own session
+        with garmindb.managed_session() as session:
+            GarminDB.Attributes._set_newer(session, 'measurement_system', str(Fit.field_enums.DisplayMeasure.metric), datetime.datetime(2019, 1, 2))
+        self.assertEqual(GarminDB.Attributes.measurements_type(garmindb), Fit.field_enums.DisplayMeasure.metric)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)